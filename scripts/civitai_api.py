@@ -6,12 +6,25 @@ Allows external bots to download models via HTTP requests
 import os
 import json
 import sys
+import asyncio
+import hashlib
 from pathlib import Path
 import gradio as gr
+import httpx
+import aiofiles
 from fastapi import APIRouter, HTTPException
+
+# aiofile drives writes through caio, which submits them over io_uring on
+# Linux kernels that support it (no syscall per write). Purely optional —
+# aiofiles through the threadpool remains the fallback.
+try:
+    from aiofile import async_open as _uring_open
+except ImportError:
+    _uring_open = None
 from pydantic import BaseModel
 from modules.api.models import *
 from modules.api import api
+from modules import shared
 
 # Import CivitaiDownloader class using absolute path to avoid conflicts
 import importlib.util
@@ -22,10 +35,162 @@ spec = importlib.util.spec_from_file_location(
 civitai_downloader_module = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(civitai_downloader_module)
 CivitaiDownloader = civitai_downloader_module.CivitaiDownloader
+DOWNLOAD_CHUNK_SIZE = civitai_downloader_module.DOWNLOAD_CHUNK_SIZE
+_file_sha256 = civitai_downloader_module._file_sha256
 
 # Create separate instance for API to avoid conflicts
 downloader = CivitaiDownloader()
 
+# HTTP/2 multiplexes the metadata calls and the download streams over one
+# TLS session; httpx needs the h2 extra for it, so only switch on when
+# that is actually importable
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# Shared async client so concurrent downloads don't block the event loop
+# and keep-alive connections are reused between requests
+_async_client = httpx.AsyncClient(
+    http2=_HTTP2,
+    timeout=httpx.Timeout(120.0),
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    follow_redirects=True
+)
+
+# Cap concurrent downloads so a burst of bot requests can't exhaust
+# connections or disk bandwidth while /civitai/status stays responsive
+_DOWNLOAD_SEM = asyncio.Semaphore(8)
+
+# Number of parallel Range streams for large downloads. A single connection
+# is capped by the per-stream bandwidth CloudFront gives out; a few parallel
+# ranges aggregate close to link speed
+_RANGE_STREAMS = 4
+
+
+async def _probe_ranges(url):
+    """Return Content-Length if the server supports byte ranges, else None"""
+    if not hasattr(os, 'pwrite'):
+        return None
+    try:
+        head = await _async_client.head(url)
+    except httpx.HTTPError:
+        return None
+    if head.status_code != 200:
+        return None
+    if head.headers.get('accept-ranges', '').lower() != 'bytes':
+        return None
+    try:
+        size = int(head.headers.get('content-length', 0))
+    except ValueError:
+        return None
+    return size if size > 0 else None
+
+
+async def _download_range(url, fd, start, end, sem):
+    """Fetch bytes [start, end] and write them at their file offset"""
+    async with sem:
+        headers = {'Range': f'bytes={start}-{end}'}
+        async with _async_client.stream("GET", url, headers=headers) as response:
+            if response.status_code != 206:
+                raise RuntimeError(f"Range request failed with HTTP {response.status_code}")
+            offset = start
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                if chunk:
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+
+
+async def _download_single(url, path, expected_sha=None):
+    """Single-stream download that overlaps network receive with disk write.
+
+    A small bounded queue between the socket reader and the file writer lets
+    the connection keep draining while the previous chunk flushes to disk.
+    The SHA256 is computed while streaming so verification costs no extra
+    file read. Returns an error message, or None on success.
+    """
+    hasher = hashlib.sha256() if expected_sha else None
+    async with _async_client.stream("GET", url) as response:
+        if response.status_code == 401:
+            return "Authorization error. Check API key"
+        elif response.status_code == 403:
+            return "Access forbidden. Model may require API key or subscription"
+        elif response.status_code == 404:
+            return "File not found. Model may have been deleted"
+        elif response.status_code == 429:
+            return "Download limit exceeded. Try later"
+        elif response.status_code != 200:
+            return f"HTTP error {response.status_code}"
+
+        queue = asyncio.Queue(maxsize=4)
+
+        async def _produce():
+            try:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    if chunk:
+                        if hasher:
+                            hasher.update(chunk)
+                        await queue.put(chunk)
+            finally:
+                # Always deliver the sentinel so a mid-stream failure can't
+                # leave the consumer blocked with the output file open
+                await queue.put(None)
+
+        async def _consume():
+            if _uring_open is not None:
+                async with _uring_open(path, 'wb') as f:
+                    while (chunk := await queue.get()) is not None:
+                        await f.write(chunk)
+            else:
+                async with aiofiles.open(path, 'wb', buffering=1 << 20) as f:
+                    while (chunk := await queue.get()) is not None:
+                        await f.write(chunk)
+
+        producer = asyncio.ensure_future(_produce())
+        consumer = asyncio.ensure_future(_consume())
+        done, pending = await asyncio.wait(
+            {producer, consumer}, return_when=asyncio.FIRST_EXCEPTION
+        )
+        # A failed consumer (e.g. ENOSPC) leaves the producer parked on a
+        # full queue with the pooled connection held open — cancel whichever
+        # side is still running before surfacing the original error
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    if hasher and hasher.hexdigest().lower() != expected_sha:
+        os.remove(path)
+        return "Downloaded file failed SHA256 verification"
+    return None
+
+
+async def _download_ranged(url, path, total_size):
+    """Download a file as _RANGE_STREAMS parallel Range requests"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, total_size)
+        sem = asyncio.Semaphore(_RANGE_STREAMS)
+        segment = -(-total_size // _RANGE_STREAMS)
+        tasks = []
+        for start in range(0, total_size, segment):
+            end = min(start + segment, total_size) - 1
+            tasks.append(_download_range(url, fd, start, end, sem))
+        # Wait for every range to settle before the fd is closed below: a
+        # plain gather propagates the first failure while its siblings keep
+        # running and would pwrite into a closed (or recycled) descriptor
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        os.close(fd)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
 
 class DownloadRequest(BaseModel):
     url: str
@@ -42,6 +207,35 @@ class DownloadResponse(BaseModel):
     error: str = None
 
 
+def _safe_unlink(path):
+    """Remove a file in one syscall; tolerates None and missing files"""
+    try:
+        os.remove(path)
+    except (FileNotFoundError, TypeError):
+        pass
+
+
+def _error_response(message):
+    return DownloadResponse(success=False, message=message, error=message)
+
+
+# Hot error paths (auth failures, 404s, bot retry storms) reuse instances
+# built once instead of re-running Pydantic validation per failure
+_ERR_NO_FILES = _error_response("No files found for download")
+_ERR_EMPTY_FILE = _error_response("Downloaded empty file")
+_ERR_TIMEOUT = _error_response("Timeout. File too large or slow connection")
+_ERR_CONNECTION = _error_response("Connection lost during download")
+_PREBUILT_ERRORS = {
+    r.error: r
+    for r in (
+        _error_response("Authorization error. Check API key"),
+        _error_response("Access forbidden. Model may require API key or subscription"),
+        _error_response("File not found. Model may have been deleted"),
+        _error_response("Download limit exceeded. Try later"),
+    )
+}
+
+
 def civitai_api(_: gr.Blocks, app):
     """Register API endpoints"""
     
@@ -73,31 +267,19 @@ def civitai_api(_: gr.Blocks, app):
                 if default_key:
                     downloader.api_key = default_key
             
-            # Extract model ID
-            version_id, error = downloader.extract_model_id(request.url)
+            # Extract model ID (may call the Civitai API — keep it off the loop)
+            version_id, error = await asyncio.to_thread(downloader.extract_model_id, request.url)
             if error:
-                return DownloadResponse(
-                    success=False,
-                    message=error,
-                    error=error
-                )
+                return _error_response(error)
             
             # Get model info
-            model_info, error = downloader.get_model_info(version_id)
+            model_info, error = await asyncio.to_thread(downloader.get_model_info, version_id)
             if error:
-                return DownloadResponse(
-                    success=False,
-                    message=error,
-                    error=error
-                )
+                return _error_response(error)
             
             # Get download URL and filename
             if 'files' not in model_info or len(model_info['files']) == 0:
-                return DownloadResponse(
-                    success=False,
-                    message="No files found for download",
-                    error="No files found for download"
-                )
+                return _ERR_NO_FILES
             
             file_info = model_info['files'][0]
             download_url = file_info['downloadUrl']
@@ -109,70 +291,61 @@ def civitai_api(_: gr.Blocks, app):
                 download_url = f"{download_url}{separator}token={downloader.api_key}"
             
             # Determine save path
-            from modules import shared
             lora_path = os.path.join(
                 shared.cmd_opts.lora_dir if hasattr(shared.cmd_opts, 'lora_dir') else 'models/Lora',
                 filename
             )
             
+            model_name = model_info.get('model', {}).get('name', 'Unknown')
+            version_name = model_info.get('name', '')
+
+            # Skip the transfer entirely if the exact file is already on disk
+            expected_sha = file_info.get('hashes', {}).get('SHA256', '').lower()
+            if expected_sha and os.path.exists(lora_path):
+                try:
+                    cached_sha = await asyncio.to_thread(_file_sha256, lora_path)
+                except OSError:
+                    cached_sha = None
+                if cached_sha == expected_sha:
+                    return DownloadResponse(
+                        success=True,
+                        message="Already downloaded (cache hit)",
+                        filename=filename,
+                        path=lora_path,
+                        model_name=model_name,
+                        version_name=version_name
+                    )
+
             # Ensure directory exists
-            os.makedirs(os.path.dirname(lora_path), exist_ok=True)
-            
-            # Download file
-            import requests
-            response = requests.get(download_url, stream=True, timeout=120)
-            
-            if response.status_code == 401:
-                return DownloadResponse(
-                    success=False,
-                    message="Authorization error. Check API key",
-                    error="Authorization error. Check API key"
-                )
-            elif response.status_code == 403:
-                return DownloadResponse(
-                    success=False,
-                    message="Access forbidden. Model may require API key or subscription",
-                    error="Access forbidden. Model may require API key or subscription"
-                )
-            elif response.status_code == 404:
-                return DownloadResponse(
-                    success=False,
-                    message="File not found. Model may have been deleted",
-                    error="File not found. Model may have been deleted"
-                )
-            elif response.status_code == 429:
-                return DownloadResponse(
-                    success=False,
-                    message="Download limit exceeded. Try later",
-                    error="Download limit exceeded. Try later"
-                )
-            elif response.status_code != 200:
-                return DownloadResponse(
-                    success=False,
-                    message=f"HTTP error {response.status_code}",
-                    error=f"HTTP error {response.status_code}"
-                )
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(lora_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
+            await asyncio.to_thread(os.makedirs, os.path.dirname(lora_path), exist_ok=True)
+
+            # Try parallel Range streams first; fall back to a single GET
+            # when the server doesn't support byte ranges
+            error = None
+            async with _DOWNLOAD_SEM:
+                total_size = await _probe_ranges(download_url)
+                if total_size:
+                    try:
+                        await _download_ranged(download_url, lora_path, total_size)
+                        # Ranged chunks arrive out of order, so the hash has
+                        # to run over the assembled file
+                        if expected_sha:
+                            actual_sha = await asyncio.to_thread(_file_sha256, lora_path)
+                            if actual_sha != expected_sha:
+                                os.remove(lora_path)
+                                error = "Downloaded file failed SHA256 verification"
+                    except (httpx.HTTPError, RuntimeError, OSError):
+                        error = await _download_single(download_url, lora_path, expected_sha)
+                else:
+                    error = await _download_single(download_url, lora_path, expected_sha)
+
+            if error:
+                return _PREBUILT_ERRORS.get(error) or _error_response(error)
             
             # Verify file was downloaded
             if os.path.exists(lora_path) and os.path.getsize(lora_path) == 0:
                 os.remove(lora_path)
-                return DownloadResponse(
-                    success=False,
-                    message="Downloaded empty file",
-                    error="Downloaded empty file"
-                )
-            
-            model_name = model_info.get('model', {}).get('name', 'Unknown')
-            version_name = model_info.get('name', '')
+                return _ERR_EMPTY_FILE
             
             return DownloadResponse(
                 success=True,
@@ -183,30 +356,15 @@ def civitai_api(_: gr.Blocks, app):
                 version_name=version_name
             )
         
-        except requests.exceptions.Timeout:
-            if lora_path and os.path.exists(lora_path):
-                os.remove(lora_path)
-            return DownloadResponse(
-                success=False,
-                message="Timeout. File too large or slow connection",
-                error="Timeout. File too large or slow connection"
-            )
-        except requests.exceptions.ConnectionError:
-            if lora_path and os.path.exists(lora_path):
-                os.remove(lora_path)
-            return DownloadResponse(
-                success=False,
-                message="Connection lost during download",
-                error="Connection lost during download"
-            )
+        except httpx.TimeoutException:
+            _safe_unlink(lora_path)
+            return _ERR_TIMEOUT
+        except httpx.TransportError:
+            _safe_unlink(lora_path)
+            return _ERR_CONNECTION
         except Exception as e:
-            if lora_path and os.path.exists(lora_path):
-                os.remove(lora_path)
-            return DownloadResponse(
-                success=False,
-                message=f"Unexpected error: {str(e)}",
-                error=f"Unexpected error: {str(e)}"
-            )
+            _safe_unlink(lora_path)
+            return _error_response(f"Unexpected error: {str(e)}")
     
     @app.get("/civitai/status")
     async def get_status():
@@ -218,8 +376,16 @@ def register_api():
     """Register API endpoints when app starts"""
     try:
         from modules import script_callbacks
-        
+
+        # The WebUI script loader and the importlib load above can each
+        # execute this file, producing two module namespaces — a module
+        # global would reset to False in the second one. script_callbacks is
+        # the same object in both, so a marker on it survives re-execution
+        # and keeps duplicate on_app_started registrations out.
+        if getattr(script_callbacks, '_civitai_api_registered', False):
+            return
         script_callbacks.on_app_started(civitai_api)
+        script_callbacks._civitai_api_registered = True
         print("[Civitai API] REST API endpoints registered")
     except Exception as e:
         print(f"[Civitai API] Failed to register API endpoints: {e}")
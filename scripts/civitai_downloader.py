@@ -1,118 +1,385 @@
 import os
 import re
 import json
+import time
+import asyncio
+import queue
+import random
+import hashlib
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from modules import shared, scripts
 
+# orjson parses Civitai's (often 10-100 KB) JSON several times faster than
+# stdlib json; fall back silently when it isn't installed
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+# One session for all Civitai traffic: keep-alive saves the TLS handshake
+# between the metadata calls and the download, and transient failures are
+# retried with backoff inside the request (honouring Retry-After on 429)
+# instead of surfacing to the user. raise_on_status=False hands back the
+# final response when retries are exhausted, so the status handling in the
+# callers (stale-cache fallback, resume loop) still sees the real code
+# instead of a RetryError
+_RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    respect_retry_after_header=True,
+    raise_on_status=False,
+    allowed_methods=['GET', 'HEAD']
+)
+_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=_RETRY)
+_SESSION = requests.Session()
+_SESSION.mount('https://', _ADAPTER)
+_SESSION.mount('http://', _ADAPTER)
+_SESSION.headers['User-Agent'] = 'civitai-downloader/1.0'
+
+
+def _set_api_key(key):
+    """Apply the key as a session default so calls stop building header dicts"""
+    if key:
+        _SESSION.headers['Authorization'] = f'Bearer {key}'
+    else:
+        _SESSION.headers.pop('Authorization', None)
+
+# 1 MiB chunks: large downloads are I/O-bound, bigger chunks mean far fewer
+# Python-level iterations and write() calls than the requests default of 8 KiB,
+# and each chunk fills the output file's write buffer exactly once
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# URL patterns compiled once instead of going through the re module cache
+# on every extract_model_id call
+_VERSION_RE = re.compile(r'modelVersionId=(\d+)')
+_MODEL_RE = re.compile(r'civitai\.com/models/(\d+)')
+
+# In-process TTL LRU cache for Civitai metadata lookups. Telegram bots love
+# to retry the same URL, so repeat lookups become dict hits instead of HTTPS
+# round-trips. TTL is jittered to avoid refresh stampedes, and the size is
+# bounded so a long-lived WebUI process doesn't accumulate a model_info
+# payload for every model ever queried.
+_META_CACHE_TTL = 300
+_META_CACHE_MAX = 128
+_meta_cache = {}
+_meta_cache_lock = threading.Lock()
+
+
+def _meta_cache_key(kind, item_id, api_key):
+    """Cache key scoped to the API key so private models don't leak between keys"""
+    key_hash = hashlib.sha256((api_key or '').encode()).hexdigest()[:16]
+    return (kind, str(item_id), key_hash)
+
+
+def _meta_cache_get(key):
+    with _meta_cache_lock:
+        entry = _meta_cache.pop(key, None)
+        if entry is None:
+            return None
+        expiry, value = entry
+        if time.monotonic() > expiry:
+            return None
+        # Re-insert so recently used entries sit at the dict's tail and
+        # eviction below always drops the least recently used key
+        _meta_cache[key] = entry
+        return value
+
+
+def _meta_cache_put(key, value):
+    with _meta_cache_lock:
+        now = time.monotonic()
+        for stale in [k for k, (expiry, _) in _meta_cache.items() if now > expiry]:
+            del _meta_cache[stale]
+        _meta_cache.pop(key, None)
+        _meta_cache[key] = (now + _META_CACHE_TTL + random.uniform(0, 30), value)
+        while len(_meta_cache) > _META_CACHE_MAX:
+            del _meta_cache[next(iter(_meta_cache))]
+
+
+# On-disk cache for model-version JSON. Revalidated with If-None-Match so
+# popular versions cost a 304 instead of a full body transfer and parse.
+_DISK_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'civitai', 'model-versions')
+
+
+def _disk_cache_load(version_id):
+    """Return (cached model_info, etag) from disk; either may be None"""
+    json_path = os.path.join(_DISK_CACHE_DIR, f"{version_id}.json")
+    try:
+        with open(json_path, 'rb') as f:
+            data = _loads(f.read())
+    except (OSError, ValueError):
+        return None, None
+
+    etag = None
+    try:
+        with open(json_path + '.etag', 'r') as f:
+            etag = f.read().strip() or None
+    except OSError:
+        pass
+    return data, etag
+
+
+def _disk_cache_store(version_id, raw_body, etag):
+    """Atomically store the raw JSON body and its ETag sidecar"""
+    try:
+        os.makedirs(_DISK_CACHE_DIR, exist_ok=True)
+        json_path = os.path.join(_DISK_CACHE_DIR, f"{version_id}.json")
+        tmp_path = json_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(raw_body)
+        os.replace(tmp_path, json_path)
+        if etag:
+            with open(json_path + '.etag', 'w') as f:
+                f.write(etag)
+    except OSError as e:
+        print(f"Error writing model info cache: {e}")
+
+# Parallel Range streams for the download path. The CDN throttles each
+# connection, so a few ranges in flight aggregate much closer to link speed
+_RANGE_STREAMS = 4
+
+
+def _probe_ranges(session, url):
+    """Return Content-Length if the server supports byte ranges, else None"""
+    if not hasattr(os, 'pwrite'):
+        return None
+    try:
+        head = session.head(url, timeout=30, allow_redirects=True)
+    except requests.RequestException:
+        return None
+    if head.status_code != 200:
+        return None
+    if head.headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return None
+    try:
+        size = int(head.headers.get('content-length', 0))
+    except ValueError:
+        return None
+    return size if size > 0 else None
+
+
+def _file_sha256(path):
+    """Hex SHA256 of a file, streamed so large models don't load into memory"""
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            # 3.11+: hashes in C and releases the GIL
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        h = hashlib.sha256()
+        while True:
+            block = f.read(DOWNLOAD_CHUNK_SIZE)
+            if not block:
+                break
+            h.update(block)
+        return h.hexdigest()
+
+
 class CivitaiDownloader:
     def __init__(self):
         self.api_key = None
+        # All instances share the pooled module session so the metadata
+        # calls and the download reuse one keep-alive connection
+        self.session = _SESSION
         self.config_file = os.path.join(scripts.basedir(), "civitai_api_key.json")
         self.default_key_file = os.path.join(scripts.basedir(), "default_api_key.txt")
-        
+        # Key files are tiny but hit on every download trigger; cache their
+        # contents with an mtime check so repeated reads skip the file I/O
+        self._key_cache = None
+        self._key_mtime = 0.0
+        self._default_key_cache = None
+        self._default_key_mtime = 0.0
+
+    @property
+    def api_key(self):
+        return self._api_key
+
+    @api_key.setter
+    def api_key(self, key):
+        # Keep the session's Authorization header in sync so every request
+        # picks the key up without a per-call headers dict
+        self._api_key = key
+        _set_api_key(key)
+
     def load_api_key(self):
         """Load saved API key from config file"""
         try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    data = json.load(f)
-                    return data.get('api_key', '')
+            mtime = os.path.getmtime(self.config_file)
+        except OSError:
+            return ''
+        if self._key_cache is not None and mtime == self._key_mtime:
+            return self._key_cache
+        try:
+            data = _loads(Path(self.config_file).read_bytes())
+            self._key_cache = data.get('api_key', '')
+            self._key_mtime = mtime
+            return self._key_cache
         except Exception as e:
             print(f"Error loading API key: {e}")
         return ''
-    
+
     def load_default_api_key(self):
         """Load default API key from file if exists"""
         try:
-            if os.path.exists(self.default_key_file):
-                with open(self.default_key_file, 'r') as f:
-                    key = f.read().strip()
-                    if key:
-                        return key
+            mtime = os.path.getmtime(self.default_key_file)
+        except OSError:
+            return None
+        if self._default_key_cache is not None and mtime == self._default_key_mtime:
+            return self._default_key_cache
+        try:
+            key = Path(self.default_key_file).read_text().strip()
+            if key:
+                self._default_key_cache = key
+                self._default_key_mtime = mtime
+                return key
         except Exception as e:
             print(f"Error loading default API key: {e}")
         return None
-    
+
     def save_api_key(self, api_key):
         """Save API key to config file"""
+        if api_key == self._key_cache:
+            return
         try:
-            with open(self.config_file, 'w') as f:
-                json.dump({'api_key': api_key}, f)
+            with open(self.config_file, 'wb') as f:
+                f.write(_dumps({'api_key': api_key}))
+            self._key_cache = api_key
+            self._key_mtime = os.path.getmtime(self.config_file)
         except Exception as e:
             print(f"Error saving API key: {e}")
         
     def extract_model_id(self, url):
         """Extract model version ID from Civitai URL"""
+        version_id, _, error = self.resolve_version(url)
+        return version_id, error
+
+    def resolve_version(self, url):
+        """Resolve a Civitai URL to (version_id, model_info, error).
+
+        For bare model-page URLs the /models/{id} response already carries the
+        newest version with its files, so model_info comes back pre-populated
+        and download_model skips the second API round-trip. model_info is None
+        when only the id could be determined.
+        """
         # Pattern for model page: https://civitai.com/models/123456
         # Pattern for version: https://civitai.com/models/123456?modelVersionId=789
-        
+
         if not url or not isinstance(url, str):
-            return None, "Неверная ссылка"
-        
+            return None, None, "Неверная ссылка"
+
         # Try to extract modelVersionId parameter
-        version_match = re.search(r'modelVersionId=(\d+)', url)
+        version_match = _VERSION_RE.search(url)
         if version_match:
-            return version_match.group(1), None
-        
+            return version_match.group(1), None, None
+
         # Try to extract model ID from URL and get latest version
-        model_match = re.search(r'civitai\.com/models/(\d+)', url)
+        model_match = _MODEL_RE.search(url)
         if model_match:
-            model_id = model_match.group(1)
-            return self.get_latest_version_id(model_id)
-        
-        return None, "Не удалось извлечь ID модели из ссылки"
-    
+            return self._latest_version_payload(model_match.group(1))
+
+        return None, None, "Не удалось извлечь ID модели из ссылки"
+
+    @staticmethod
+    def _normalize_version_payload(version, model_data):
+        """Shape a modelVersions[] entry like the model-versions endpoint"""
+        payload = dict(version)
+        payload.setdefault('model', {
+            'name': model_data.get('name', 'Unknown'),
+            'type': model_data.get('type'),
+            'nsfw': model_data.get('nsfw'),
+        })
+        return payload
+
     def get_latest_version_id(self, model_id):
         """Get the latest version ID for a model"""
+        version_id, _, error = self._latest_version_payload(model_id)
+        return version_id, error
+
+    def _latest_version_payload(self, model_id):
+        """Fetch a model's newest version in one round-trip.
+
+        Returns (version_id, model_info, error). The normalized payload is
+        primed into the metadata cache so a later get_model_info is free.
+        """
+        cache_key = _meta_cache_key('model', model_id, self.api_key)
+        cached = _meta_cache_get(cache_key)
+        if cached is not None:
+            version_info = _meta_cache_get(_meta_cache_key('version', cached, self.api_key))
+            return cached, version_info, None
+
         try:
-            headers = {}
-            if self.api_key:
-                headers['Authorization'] = f'Bearer {self.api_key}'
-            
-            response = requests.get(
+            response = self.session.get(
                 f'https://civitai.com/api/v1/models/{model_id}',
-                headers=headers,
                 timeout=30
             )
-            
+
             if response.status_code == 200:
-                data = response.json()
+                data = _loads(response.content)
                 if 'modelVersions' in data and len(data['modelVersions']) > 0:
-                    return str(data['modelVersions'][0]['id']), None
-                return None, "Модель не содержит версий для скачивания"
+                    version = data['modelVersions'][0]
+                    version_id = str(version['id'])
+                    _meta_cache_put(cache_key, version_id)
+                    if version.get('files'):
+                        payload = self._normalize_version_payload(version, data)
+                        _meta_cache_put(_meta_cache_key('version', version_id, self.api_key), payload)
+                        return version_id, payload, None
+                    return version_id, None, None
+                return None, None, "Модель не содержит версий для скачивания"
             elif response.status_code == 401:
-                return None, "Неверный API ключ. Проверьте ключ или удалите его для публичных моделей"
+                return None, None, "Неверный API ключ. Проверьте ключ или удалите его для публичных моделей"
             elif response.status_code == 403:
-                return None, "Доступ запрещён. Возможно, модель приватная и требует API ключ"
+                return None, None, "Доступ запрещён. Возможно, модель приватная и требует API ключ"
             elif response.status_code == 404:
-                return None, "Модель не найдена. Проверьте правильность ссылки"
+                return None, None, "Модель не найдена. Проверьте правильность ссылки"
             elif response.status_code == 429:
-                return None, "Превышен лимит запросов. Подождите немного и попробуйте снова"
+                return None, None, "Превышен лимит запросов. Подождите немного и попробуйте снова"
             else:
-                return None, f"Ошибка сервера Civitai (код {response.status_code})"
+                return None, None, f"Ошибка сервера Civitai (код {response.status_code})"
         except requests.exceptions.Timeout:
-            return None, "Превышено время ожидания. Проверьте подключение к интернету"
+            return None, None, "Превышено время ожидания. Проверьте подключение к интернету"
         except requests.exceptions.ConnectionError:
-            return None, "Не удалось подключиться к Civitai. Проверьте подключение к интернету"
+            return None, None, "Не удалось подключиться к Civitai. Проверьте подключение к интернету"
         except Exception as e:
-            return None, f"Ошибка при запросе к API: {str(e)}"
+            return None, None, f"Ошибка при запросе к API: {str(e)}"
     
     def get_model_info(self, version_id):
         """Get model information from Civitai API"""
+        cache_key = _meta_cache_key('version', version_id, self.api_key)
+        cached = _meta_cache_get(cache_key)
+        if cached is not None:
+            return cached, None
+
+        # The disk copy doubles as a stale fallback: when Civitai is
+        # rate-limiting or unreachable, downloads proceed from cached metadata
+        cached_info, etag = _disk_cache_load(version_id)
+
         try:
             headers = {}
-            if self.api_key:
-                headers['Authorization'] = f'Bearer {self.api_key}'
-            
-            response = requests.get(
+            if cached_info is not None and etag:
+                headers['If-None-Match'] = etag
+
+            response = self.session.get(
                 f'https://civitai.com/api/v1/model-versions/{version_id}',
                 headers=headers,
                 timeout=30
             )
-            
-            if response.status_code == 200:
-                return response.json(), None
+
+            if response.status_code == 304 and cached_info is not None:
+                _meta_cache_put(cache_key, cached_info)
+                return cached_info, None
+            elif response.status_code == 200:
+                model_info = _loads(response.content)
+                _meta_cache_put(cache_key, model_info)
+                _disk_cache_store(version_id, response.content, response.headers.get('ETag'))
+                return model_info, None
             elif response.status_code == 401:
                 return None, "Неверный API ключ. Проверьте ключ или удалите его"
             elif response.status_code == 403:
@@ -120,16 +387,136 @@ class CivitaiDownloader:
             elif response.status_code == 404:
                 return None, "Версия модели не найдена"
             elif response.status_code == 429:
+                if cached_info is not None:
+                    return cached_info, None
                 return None, "Превышен лимит запросов. Подождите и попробуйте снова"
             else:
+                if cached_info is not None:
+                    return cached_info, None
                 return None, f"Ошибка сервера Civitai (код {response.status_code})"
         except requests.exceptions.Timeout:
+            if cached_info is not None:
+                return cached_info, None
             return None, "Превышено время ожидания. Проверьте интернет-соединение"
         except requests.exceptions.ConnectionError:
+            if cached_info is not None:
+                return cached_info, None
             return None, "Не удалось подключиться к Civitai. Проверьте интернет"
         except Exception as e:
             return None, f"Ошибка запроса: {str(e)}"
     
+    def _download_ranged(self, url, path, total_size, progress=None):
+        """Download a file as _RANGE_STREAMS parallel Range requests.
+
+        Each thread streams its segment straight to the right offset with
+        os.pwrite into a preallocated file. Returns an error message, or
+        None on success; the partial file is removed on failure so the
+        single-stream fallback starts clean.
+        """
+        state_lock = threading.Lock()
+        state = {'downloaded': 0, 'last_pct': -1, 'last_t': time.monotonic()}
+        errors = []
+
+        def _fetch(start, end):
+            try:
+                response = self.session.get(
+                    url,
+                    headers={'Range': f'bytes={start}-{end}'},
+                    stream=True,
+                    timeout=120
+                )
+                if response.status_code != 206:
+                    raise requests.exceptions.HTTPError(f"HTTP {response.status_code}")
+
+                response.raw.decode_content = True
+                buf = bytearray(DOWNLOAD_CHUNK_SIZE)
+                offset = start
+                while True:
+                    n = response.raw.readinto(buf)
+                    if not n:
+                        break
+                    os.pwrite(fd, memoryview(buf)[:n], offset)
+                    offset += n
+                    # Report at most one update per percent per 250 ms —
+                    # per-chunk updates flood the UI on fast links
+                    report = False
+                    with state_lock:
+                        state['downloaded'] += n
+                        downloaded = state['downloaded']
+                        pct = downloaded * 100 // total_size
+                        now = time.monotonic()
+                        if progress and pct != state['last_pct'] and now - state['last_t'] > 0.25:
+                            state['last_pct'] = pct
+                            state['last_t'] = now
+                            report = True
+                    if report:
+                        progress_val = 0.3 + (downloaded / total_size) * 0.7
+                        progress(progress_val, desc=f"Скачивание: {downloaded / 1024 / 1024:.1f} / {total_size / 1024 / 1024:.1f} MB")
+            except Exception as e:
+                errors.append(e)
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, total_size)
+
+            segment = -(-total_size // _RANGE_STREAMS)
+            threads = []
+            for start in range(0, total_size, segment):
+                end = min(start + segment, total_size) - 1
+                t = threading.Thread(target=_fetch, args=(start, end), daemon=True)
+                threads.append(t)
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            os.close(fd)
+
+        if errors:
+            try:
+                Path(path).unlink(missing_ok=True)
+            except OSError:
+                pass
+            return f"❌ Ошибка при параллельном скачивании: {errors[0]}"
+        return None
+
+    async def download_model_async(self, url, api_key, progress=None):
+        """Async wrapper around download_model.
+
+        Runs the blocking HTTP and file I/O in a worker thread so an event
+        loop coordinating several downloads keeps servicing other sockets.
+        """
+        return await asyncio.to_thread(self.download_model, url, api_key, progress)
+
+    def download_model_stream(self, url, api_key):
+        """Generator variant of download_model for streaming UIs.
+
+        The blocking download runs in a worker thread; progress descriptions
+        are handed over through a queue and yielded as they arrive, followed
+        by the final result message. This lets a Gradio handler yield interim
+        status without holding its queue worker for the whole transfer.
+        """
+        events = queue.Queue()
+        result = {}
+
+        def _progress(value, desc=None):
+            events.put(desc or f"{value * 100:.0f}%")
+
+        def _worker():
+            try:
+                result['message'] = self.download_model(url, api_key, progress=_progress)
+            except Exception as e:
+                result['message'] = f"❌ Неизвестная ошибка: {str(e)}"
+            finally:
+                events.put(None)
+
+        thread = threading.Thread(target=_worker, daemon=True)
+        thread.start()
+        while (desc := events.get()) is not None:
+            yield desc
+        thread.join()
+        yield result['message']
+
     def download_model(self, url, api_key, progress=None):
         """Download LoRA model from Civitai"""
         self.api_key = api_key.strip() if api_key else None
@@ -145,28 +532,30 @@ class CivitaiDownloader:
             self.save_api_key(self.api_key)
         else:
             # If key is empty, delete saved key
-            if os.path.exists(self.config_file):
-                try:
-                    os.remove(self.config_file)
-                except Exception as e:
-                    print(f"Error deleting API key: {e}")
+            try:
+                Path(self.config_file).unlink(missing_ok=True)
+            except OSError as e:
+                print(f"Error deleting API key: {e}")
         
         if not url:
             return "❌ Введите ссылку на модель"
         
         if progress:
             progress(0, desc="Извлечение ID модели...")
-        version_id, error = self.extract_model_id(url)
-        
-        if error:
-            return f"❌ {error}"
-        
-        if progress:
-            progress(0.2, desc="Получение информации о модели...")
-        model_info, error = self.get_model_info(version_id)
-        
+        version_id, model_info, error = self.resolve_version(url)
+
         if error:
             return f"❌ {error}"
+
+        # Model-page URLs come back with the version payload already attached;
+        # only version links need the second API call
+        if model_info is None:
+            if progress:
+                progress(0.2, desc="Получение информации о модели...")
+            model_info, error = self.get_model_info(version_id)
+
+            if error:
+                return f"❌ {error}"
         
         # Get download URL and filename
         if 'files' not in model_info or len(model_info['files']) == 0:
@@ -183,69 +572,138 @@ class CivitaiDownloader:
         
         # Determine save path
         lora_path = os.path.join(shared.cmd_opts.lora_dir if hasattr(shared.cmd_opts, 'lora_dir') else 'models/Lora', filename)
-        
+
+        model_name = model_info.get('model', {}).get('name', 'Unknown')
+        version_name = model_info.get('name', '')
+
+        # Skip the transfer entirely if the exact file is already on disk
+        expected_sha = file_info.get('hashes', {}).get('SHA256', '').lower()
+        if expected_sha and os.path.exists(lora_path):
+            try:
+                if _file_sha256(lora_path) == expected_sha:
+                    return f"✅ Модель уже скачана, хэш совпадает\n\nМодель: {model_name}\nВерсия: {version_name}\nФайл: {filename}\nПуть: {lora_path}"
+            except OSError:
+                pass
+
         # Ensure directory exists
         os.makedirs(os.path.dirname(lora_path), exist_ok=True)
         
         if progress:
             progress(0.3, desc=f"Скачивание {filename}...")
-        
-        try:
-            response = requests.get(download_url, stream=True, timeout=120)
-            
-            if response.status_code == 401:
-                return "❌ Ошибка авторизации. Проверьте API ключ"
-            elif response.status_code == 403:
-                return "❌ Доступ запрещён. Возможно, модель требует API ключ или подписку"
-            elif response.status_code == 404:
-                return "❌ Файл не найден. Возможно, модель была удалена"
-            elif response.status_code == 429:
-                return "❌ Превышен лимит скачиваний. Попробуйте позже"
-            
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(lora_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
+
+        # Multi-connection download first: the CDN caps per-stream bandwidth,
+        # so parallel ranges finish big files several times faster. Servers
+        # without range support fall through to the resumable single stream.
+        ranged_size = _probe_ranges(self.session, download_url)
+        if ranged_size:
+            error = self._download_ranged(download_url, lora_path, ranged_size, progress)
+            if error is None:
+                if expected_sha and _file_sha256(lora_path) != expected_sha:
+                    os.remove(lora_path)
+                    return "❌ Хэш SHA256 не совпадает. Файл повреждён, попробуйте снова"
+                return f"✅ Успешно скачано!\n\nМодель: {model_name}\nВерсия: {version_name}\nФайл: {filename}\nПуть: {lora_path}"
+
+        # Transient failures keep the partial file and resume from its size
+        # with a Range request; only definitive errors throw bytes away
+        last_error = "❌ Не удалось скачать файл. Попробуйте позже"
+        for attempt in range(3):
+            if attempt:
+                time.sleep(2 ** attempt)
+
+            try:
+                existing = os.path.getsize(lora_path) if os.path.exists(lora_path) else 0
+                headers = {}
+                if existing:
+                    headers['Range'] = f'bytes={existing}-'
+
+                response = self.session.get(download_url, stream=True, timeout=120, headers=headers)
+
+                if response.status_code == 401:
+                    return "❌ Ошибка авторизации. Проверьте API ключ"
+                elif response.status_code == 403:
+                    return "❌ Доступ запрещён. Возможно, модель требует API ключ или подписку"
+                elif response.status_code == 404:
+                    return "❌ Файл не найден. Возможно, модель была удалена"
+                elif response.status_code == 429:
+                    last_error = "❌ Превышен лимит скачиваний. Попробуйте позже"
+                    continue
+                elif response.status_code == 416:
+                    # Range not satisfiable: partial file is stale, start over
+                    os.remove(lora_path)
+                    continue
+
+                response.raise_for_status()
+
+                # A 200 on a Range request means the server restarted from zero
+                if response.status_code != 206:
+                    existing = 0
+
+                content_length = int(response.headers.get('content-length', 0))
+                total_size = existing + content_length
+                downloaded = existing
+
+                # Reuse one buffer instead of allocating a fresh bytes object
+                # per chunk like iter_content does
+                response.raw.decode_content = True
+                buf = bytearray(DOWNLOAD_CHUNK_SIZE)
+
+                # Hash while streaming so integrity verification doesn't need
+                # a second pass; impossible when appending to a partial file
+                hasher = hashlib.sha256() if expected_sha and not existing else None
+
+                # Large write buffer so each chunk lands in one write() instead
+                # of being split across the 8 KiB default buffer
+                mode = 'ab' if existing else 'wb'
+                last_pct = -1
+                last_t = time.monotonic()
+                with open(lora_path, mode, buffering=1 << 20) as f:
+                    while True:
+                        n = response.raw.readinto(buf)
+                        if not n:
+                            break
+                        view = memoryview(buf)[:n]
+                        if hasher:
+                            hasher.update(view)
+                        f.write(view)
+                        downloaded += n
                         if total_size > 0 and progress:
-                            progress_val = 0.3 + (downloaded / total_size) * 0.7
-                            progress(progress_val, desc=f"Скачивание: {downloaded / 1024 / 1024:.1f} / {total_size / 1024 / 1024:.1f} MB")
-            
-            # Verify file was downloaded
-            if os.path.exists(lora_path) and os.path.getsize(lora_path) == 0:
-                os.remove(lora_path)
-                return "❌ Скачан пустой файл. Попробуйте снова"
-            
-            model_name = model_info.get('model', {}).get('name', 'Unknown')
-            version_name = model_info.get('name', '')
-            
-            return f"✅ Успешно скачано!\n\nМодель: {model_name}\nВерсия: {version_name}\nФайл: {filename}\nПуть: {lora_path}"
-        
-        except requests.exceptions.Timeout:
-            if os.path.exists(lora_path):
-                os.remove(lora_path)
-            return "❌ Превышено время ожидания. Файл слишком большой или медленное соединение"
-        except requests.exceptions.ConnectionError:
-            if os.path.exists(lora_path):
-                os.remove(lora_path)
-            return "❌ Потеряно соединение с интернетом во время скачивания"
-        except requests.exceptions.HTTPError as e:
-            if os.path.exists(lora_path):
-                os.remove(lora_path)
-            return f"❌ Ошибка HTTP при скачивании: {e}"
-        except OSError as e:
-            if os.path.exists(lora_path):
-                os.remove(lora_path)
-            return f"❌ Ошибка записи файла: {e}. Проверьте права доступа и свободное место"
-        except Exception as e:
-            if os.path.exists(lora_path):
-                os.remove(lora_path)
-            return f"❌ Неизвестная ошибка: {str(e)}"
+                            # At most one update per percent per 250 ms —
+                            # per-chunk updates flood the UI on fast links
+                            pct = downloaded * 100 // total_size
+                            now = time.monotonic()
+                            if pct != last_pct and now - last_t > 0.25:
+                                last_pct = pct
+                                last_t = now
+                                progress_val = 0.3 + (downloaded / total_size) * 0.7
+                                progress(progress_val, desc=f"Скачивание: {downloaded / 1024 / 1024:.1f} / {total_size / 1024 / 1024:.1f} MB")
+
+                # Verify file was downloaded
+                if os.path.exists(lora_path) and os.path.getsize(lora_path) == 0:
+                    os.remove(lora_path)
+                    return "❌ Скачан пустой файл. Попробуйте снова"
+
+                if expected_sha:
+                    digest = hasher.hexdigest() if hasher else _file_sha256(lora_path)
+                    if digest.lower() != expected_sha:
+                        os.remove(lora_path)
+                        return "❌ Хэш SHA256 не совпадает. Файл повреждён, попробуйте снова"
+
+                return f"✅ Успешно скачано!\n\nМодель: {model_name}\nВерсия: {version_name}\nФайл: {filename}\nПуть: {lora_path}"
+
+            except requests.exceptions.Timeout:
+                last_error = "❌ Превышено время ожидания. Файл слишком большой или медленное соединение"
+            except requests.exceptions.ConnectionError:
+                last_error = "❌ Потеряно соединение с интернетом во время скачивания"
+            except requests.exceptions.HTTPError as e:
+                last_error = f"❌ Ошибка HTTP при скачивании: {e}"
+            except OSError as e:
+                Path(lora_path).unlink(missing_ok=True)
+                return f"❌ Ошибка записи файла: {e}. Проверьте права доступа и свободное место"
+            except Exception as e:
+                Path(lora_path).unlink(missing_ok=True)
+                return f"❌ Неизвестная ошибка: {str(e)}"
+
+        return last_error
 
 # Create a single global instance
 downloader = CivitaiDownloader()
@@ -5,8 +5,12 @@
 с расширением для скачивания моделей на удалённые PC с SD WebUI
 """
 
+import asyncio
 import requests
 import json
+import aiohttp
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Optional
 
 
@@ -25,11 +29,46 @@ class CivitaiDownloaderClient:
                 ]
         """
         self.servers = servers
-    
+        # Одна сессия на все синхронные запросы: keep-alive переиспользует
+        # TCP-соединения к каждому серверу вместо нового handshake на вызов
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max(len(servers), 1),
+            pool_maxsize=max(len(servers), 1) * 4
+        )
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        # Общий пул потоков для синхронных параллельных проверок; создаётся
+        # один раз, чтобы не платить за запуск потоков при каждом вызове
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(len(self.servers), 1))
+        return self._executor
+
+    def check_all_servers(self) -> Dict[str, bool]:
+        """
+        Параллельная проверка статуса всех серверов без asyncio
+
+        Те же блокирующие requests-вызовы, но перекрытые по времени через
+        ThreadPoolExecutor — удобно в синхронном коде бота.
+        """
+        executor = self._get_executor()
+        futures = {
+            executor.submit(self.check_server_status, server["url"]): server["name"]
+            for server in self.servers
+        }
+        return {futures[future]: future.result() for future in as_completed(futures)}
+
+    def get_session(self) -> requests.Session:
+        """Доступ к сессии, чтобы можно было настроить ретраи/заголовки"""
+        return self._session
+
     def check_server_status(self, server_url: str) -> bool:
         """Проверка доступности сервера"""
         try:
-            response = requests.get(
+            response = self._session.get(
                 f"{server_url}/civitai/status",
                 timeout=5
             )
@@ -69,7 +108,7 @@ class CivitaiDownloaderClient:
                 "api_key": api_key
             }
             
-            response = requests.post(
+            response = self._session.post(
                 f"{server_url}/civitai/download",
                 json=payload,
                 timeout=300  # 5 минут на скачивание
@@ -94,14 +133,71 @@ class CivitaiDownloaderClient:
                 "message": f"Ошибка: {str(e)}"
             }
     
-    def download_to_all_servers(
-        self, 
-        civitai_url: str, 
+    async def _check_status(self, session: aiohttp.ClientSession, server_url: str) -> bool:
+        """Асинхронная проверка доступности сервера"""
+        try:
+            async with session.get(
+                f"{server_url}/civitai/status",
+                timeout=aiohttp.ClientTimeout(total=5)
+            ) as response:
+                return response.status == 200
+        except Exception as e:
+            print(f"Server {server_url} is offline: {e}")
+            return False
+
+    async def _download(
+        self,
+        session: aiohttp.ClientSession,
+        server_url: str,
+        civitai_url: str,
+        api_key: Optional[str] = None
+    ) -> Dict:
+        """Асинхронное скачивание модели на один сервер"""
+        try:
+            payload = {
+                "url": civitai_url,
+                "api_key": api_key
+            }
+
+            # Без предварительного пинга: недоступный сервер выявит сам POST
+            # (ошибка соединения ниже), а лишний round-trip не нужен
+            async with session.post(
+                f"{server_url}/civitai/download",
+                json=payload
+            ) as response:
+                if response.status == 200:
+                    return await response.json()
+                return {
+                    "success": False,
+                    "message": f"Error {response.status}: {await response.text()}"
+                }
+        except aiohttp.ClientConnectionError:
+            return {
+                "success": False,
+                "message": "Сервер недоступен"
+            }
+        except asyncio.TimeoutError:
+            return {
+                "success": False,
+                "message": "Timeout: скачивание заняло слишком много времени"
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"Ошибка: {str(e)}"
+            }
+
+    async def download_to_all_servers(
+        self,
+        civitai_url: str,
         api_key: Optional[str] = None
     ) -> Dict[str, Dict]:
         """
-        Скачивание модели на все доступные серверы
-        
+        Скачивание модели на все доступные серверы (параллельно)
+
+        Все серверы обрабатываются одновременно, поэтому общее время равно
+        самому медленному серверу, а не сумме всех таймаутов.
+
         Returns:
             Словарь с результатами для каждого сервера:
             {
@@ -109,33 +205,41 @@ class CivitaiDownloaderClient:
                 "PC2": {"success": False, ...}
             }
         """
-        results = {}
-        
-        for server in self.servers:
-            server_name = server["name"]
-            server_url = server["url"]
-            
-            # Проверка доступности
-            if not self.check_server_status(server_url):
-                results[server_name] = {
-                    "success": False,
-                    "message": "Сервер недоступен"
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=300)  # 5 минут на скачивание
+        ) as session:
+            async with asyncio.TaskGroup() as tg:
+                tasks = {
+                    server["name"]: tg.create_task(
+                        self._download(session, server["url"], civitai_url, api_key)
+                    )
+                    for server in self.servers
                 }
-                continue
-            
-            # Скачивание
-            result = self.download_model(server_url, civitai_url, api_key)
-            results[server_name] = result
-        
-        return results
-    
-    def get_available_servers(self) -> List[str]:
-        """Получение списка доступных серверов"""
-        available = []
-        for server in self.servers:
-            if self.check_server_status(server["url"]):
-                available.append(server["name"])
-        return available
+        return {name: task.result() for name, task in tasks.items()}
+
+    def download_to_all_servers_sync(
+        self,
+        civitai_url: str,
+        api_key: Optional[str] = None
+    ) -> Dict[str, Dict]:
+        """Синхронная обёртка для кода, который не может использовать await"""
+        return asyncio.run(self.download_to_all_servers(civitai_url, api_key))
+
+    async def get_available_servers(self) -> List[str]:
+        """Получение списка доступных серверов (все проверки параллельно)"""
+        async with aiohttp.ClientSession() as session:
+            async with asyncio.TaskGroup() as tg:
+                tasks = {
+                    server["name"]: tg.create_task(
+                        self._check_status(session, server["url"])
+                    )
+                    for server in self.servers
+                }
+        return [name for name, task in tasks.items() if task.result()]
+
+    def get_available_servers_sync(self) -> List[str]:
+        """Синхронная обёртка для кода, который не может использовать await"""
+        return asyncio.run(self.get_available_servers())
 
 
 # ============================================================================
@@ -153,7 +257,7 @@ def example_telegram_bot():
     ])
     
     # ===== Пример 1: Проверка доступных серверов =====
-    available = client.get_available_servers()
+    available = client.get_available_servers_sync()
     print(f"Доступные серверы: {', '.join(available)}")
     
     # ===== Пример 2: Скачивание на один сервер =====
@@ -174,7 +278,7 @@ def example_telegram_bot():
         print(f"❌ Ошибка: {result['message']}")
     
     # ===== Пример 3: Скачивание на все серверы =====
-    results = client.download_to_all_servers(civitai_url, api_key)
+    results = client.download_to_all_servers_sync(civitai_url, api_key)
     
     for server_name, result in results.items():
         if result["success"]:
@@ -213,7 +317,7 @@ async def download_command(message: types.Message):
     civitai_url = args[1]
     
     # Показываем доступные серверы
-    available = client.get_available_servers()
+    available = await client.get_available_servers()
     if not available:
         await message.reply("❌ Нет доступных серверов")
         return
@@ -221,7 +325,7 @@ async def download_command(message: types.Message):
     await message.reply(f"⏳ Скачиваю на {len(available)} серверов...")
     
     # Скачиваем на все серверы
-    results = client.download_to_all_servers(civitai_url)
+    results = await client.download_to_all_servers(civitai_url)
     
     # Формируем ответ
     response_lines = ["📊 Результаты скачивания:\n"]
@@ -241,14 +345,13 @@ async def download_command(message: types.Message):
 
 @dp.message(Command("servers"))
 async def servers_command(message: types.Message):
-    # Показываем статус всех серверов
+    # Показываем статус всех серверов (проверки идут параллельно)
     status_lines = ["🖥 Статус серверов:\n"]
-    
-    for server in client.servers:
-        is_online = client.check_server_status(server["url"])
+
+    for server_name, is_online in client.check_all_servers().items():
         status = "🟢 Онлайн" if is_online else "🔴 Оффлайн"
-        status_lines.append(f"{status} {server['name']}")
-    
+        status_lines.append(f"{status} {server_name}")
+
     await message.reply("\n".join(status_lines))
 
 # Запуск бота
@@ -277,7 +380,7 @@ async def download(update: Update, context: ContextTypes.DEFAULT_TYPE):
     civitai_url = context.args[0]
     await update.message.reply_text("⏳ Скачиваю...")
     
-    results = client.download_to_all_servers(civitai_url)
+    results = await client.download_to_all_servers(civitai_url)
     
     for server_name, result in results.items():
         if result["success"]: